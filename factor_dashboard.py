@@ -1,10 +1,15 @@
+import os
+import threading
 import streamlit as st
+import numpy as np
 import pandas as pd
+import requests
 import yfinance as yf
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from pathlib import Path
 import matplotlib.colors as mcolors
-import matplotlib.pyplot as plt
-import seaborn as sns
+import plotly.graph_objects as go
 
 # --- Dashboard Configuration ---
 st.set_page_config(page_title="Market Performance Dashboard (USD)", layout="wide")
@@ -49,27 +54,160 @@ SECTOR_TICKERS = {
     "Communication Svcs": "VOX",
 }
 
-@st.cache_data(ttl=3600) # Cache data for 1 hour
-def get_performance_data(tickers, start_date):
-    raw_data = yf.download(list(tickers.values()), start=start_date, progress=False, auto_adjust=True)
+ALL_TICKERS = {**FACTOR_TICKERS, **REGION_TICKERS, **SECTOR_TICKERS}
+_ALL_TICKER_TO_NAME = {v: k for k, v in ALL_TICKERS.items()}
+
+# --- On-disk price cache (survives restarts and is shared across workers) ---
+CACHE_DIR = Path.home() / ".cache" / "factor_dashboard"
+
+
+# --- Yahoo Finance chart endpoint (close prices only, one pooled session for all threads) ---
+CHART_URL = "https://query2.finance.yahoo.com/v8/finance/chart/{symbol}"
+_SESSION = requests.Session()
+_SESSION.headers["User-Agent"] = "Mozilla/5.0"
+_SESSION.mount("https://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+
+def _download_close_raw(symbol, start_date):
+    """Download the adjusted closing prices of a single ticker from the raw chart JSON."""
+    params = {
+        "period1": int(pd.Timestamp(start_date, tz="UTC").timestamp()),
+        "period2": int(datetime.now().timestamp()),
+        "interval": "1d",
+        "events": "div,splits",
+        "includeAdjustedClose": "true",
+    }
+    response = _SESSION.get(CHART_URL.format(symbol=symbol), params=params, timeout=10)
+    response.raise_for_status()
+    result = response.json()["chart"]["result"][0]
+
+    if "timestamp" not in result:
+        return pd.Series(dtype=float, name='Close')
+
+    # Bars are stamped at the market open in UTC; index them by exchange-local trading day
+    index = (
+        pd.to_datetime(result["timestamp"], unit="s", utc=True)
+        .tz_convert(result["meta"]["exchangeTimezoneName"])
+        .tz_localize(None)
+        .normalize()
+    )
+    close = pd.Series(result["indicators"]["adjclose"][0]["adjclose"], index=index, dtype=float, name='Close')
+    return close[~close.index.duplicated(keep='last')]
+
+
+def _download_close(symbol, start_date):
+    """Download the adjusted closing prices of a single ticker."""
+    try:
+        return _download_close_raw(symbol, start_date)
+    except (requests.RequestException, ValueError, KeyError, IndexError, TypeError):
+        pass # Fall back to yfinance, which handles Yahoo's cookies and rate limiting
+
+    try:
+        history = yf.Ticker(symbol).history(start=start_date, auto_adjust=True)
+    except Exception: # Network/backend errors vary by yfinance version; treat them as no data
+        return pd.Series(dtype=float, name='Close')
+
+    if history.empty or 'Close' not in history:
+        return pd.Series(dtype=float, name='Close')
+
+    close = history['Close']
+    close.index = close.index.tz_localize(None)
+    return close
+
+
+CACHE_OVERLAP_DAYS = 10 # Calendar days of settled bars refetched to validate the cache
+CACHE_RTOL = 1e-5 # Max relative difference between cached and refetched settled bars
+
+
+def _fetch_one(symbol, start_date):
+    """
+    Fetch the closing prices of a single ticker as a Series named after its symbol.
+    Historical bars are kept on disk, so only the tail since the last cached bar is downloaded.
+    Adjusted prices are restated after every split or dividend, so the tail is refetched with
+    a few settled bars of overlap; if those no longer match the cache, the whole window is refetched.
+    """
+    cache_path = CACHE_DIR / f"{symbol}.parquet"
+    start = pd.Timestamp(start_date)
+
+    cached = pd.Series(dtype=float, name='Close')
+    if cache_path.exists():
+        try:
+            cached = pd.read_parquet(cache_path, engine='pyarrow')['Close']
+        except (OSError, ValueError, KeyError):
+            cached = pd.Series(dtype=float, name='Close')
+
+    close = None
+    # Only extend the cache if it reaches back to the requested start date
+    if not cached.empty and cached.index[0] <= start + pd.DateOffset(days=7):
+        last_cached_date = cached.index[-1]
+        overlap_start = last_cached_date - pd.DateOffset(days=CACHE_OVERLAP_DAYS)
+        delta = _download_close(symbol, overlap_start.strftime('%Y-%m-%d'))
+
+        if delta.empty: # Download failed; serve the cache as it is
+            return cached.loc[start:].rename(symbol)
+
+        # The last cached bar may have been intraday, so only compare the bars before it
+        settled = cached.index[(cached.index >= overlap_start) & (cached.index < last_cached_date)]
+        settled = settled.intersection(delta.index)
+        if len(settled) and np.allclose(cached[settled], delta[settled], rtol=CACHE_RTOL, equal_nan=True):
+            close = pd.concat([cached[cached.index < delta.index[0]], delta])
+
+    # No usable cache, or its price basis is stale: download the whole window
+    if close is None:
+        close = _download_close(symbol, start_date)
+
+    if close.empty:
+        return pd.Series(dtype=float, name=symbol)
+
+    # Write to a temporary file first so concurrent readers never see a partial file
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        close.to_frame('Close').to_parquet(tmp_path, engine='pyarrow')
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass # The disk cache is best-effort; the downloaded data is still served
 
-    if raw_data.empty or 'Close' not in raw_data:
+    return close.loc[start:].rename(symbol)
+
+
+@st.cache_data(ttl=3600) # Cache data for 1 hour
+def _get_data_cached(symbols, start_date):
+    # Downloads are I/O-bound, so fetch each ticker on its own thread
+    with ThreadPoolExecutor(max_workers=min(16, len(symbols))) as executor:
+        futures = [executor.submit(_fetch_one, symbol, start_date) for symbol in symbols]
+        series_list = [future.result() for future in as_completed(futures)]
+
+    series_list = [series for series in series_list if not series.empty]
+    if not series_list:
         st.error(f"Could not download market data for one or more tickers.")
         return pd.DataFrame()
-    
-    # Keep only closing prices and drop empty columns
-    data = raw_data['Close'].dropna(axis=1, how='all')
+
+    # Keep the requested symbol order and drop empty columns
+    data = pd.concat(series_list, axis=1).sort_index()
+    data = data[[symbol for symbol in symbols if symbol in data.columns]].dropna(axis=1, how='all')
 
     if data.empty:
         return pd.DataFrame()
 
-    # Rename columns from tickers to human-readable names
-    ticker_to_name = {v: k for k, v in tickers.items()}
-    data.rename(columns=ticker_to_name, inplace=True)
-        
+    # Single precision is plenty for display and halves the memory moved by returns/correlation
+    data = data.astype(np.float32)
+
     return data
 
 
+def get_performance_data(tickers, start_date):
+    # Cache on a tuple of symbols, which is much cheaper for Streamlit to hash than the ticker dict
+    data = _get_data_cached(tuple(sorted(tickers.values())), start_date)
+
+    if data.empty:
+        return data
+
+    # Rename columns from tickers to human-readable names, in the order of the ticker dict
+    data.rename(columns=_ALL_TICKER_TO_NAME, inplace=True)
+    return data[[name for name in tickers if name in data.columns]]
+
+
 def calculate_performance_metrics(data):
     """
     Calculates performance for dynamic To-Date timeframes: 1 Day, Week, Month, Quarter, and Year.
@@ -78,24 +216,28 @@ def calculate_performance_metrics(data):
         return pd.DataFrame()
 
     latest_price = data.iloc[-1]
-    today = pd.to_datetime(datetime.now().date())
+    today = datetime.now().date()
 
     # --- Define Start Dates for each period ---
-    start_of_week = today - pd.offsets.Week(weekday=0)
-    start_of_month = today - pd.offsets.MonthBegin(1)
-    start_of_quarter = today - pd.offsets.QuarterBegin(1, startingMonth=1)
+    start_of_week = today - timedelta(days=today.weekday())
+    start_of_month = today.replace(day=1)
+    start_of_quarter = today.replace(month=((today.month - 1) // 3) * 3 + 1, day=1)
+    start_of_year = today.replace(month=1, day=1)
     
     # --- Find the price at the close of business BEFORE the period started ---
+    # (one forward-filled reindex for all boundaries; YTD uses the last price of the previous year).
+    # Columns are forward-filled first, so a ticker missing a bar on a boundary uses its last earlier price
     try:
-        sow_price = data.asof(start_of_week - pd.DateOffset(days=1))
-        som_price = data.asof(start_of_month - pd.DateOffset(days=1))
-        soq_price = data.asof(start_of_quarter - pd.DateOffset(days=1))
-        
-        # For YTD, get the last price of the previous year
-        last_year_data = data[data.index.year == today.year - 1]
-        if not last_year_data.empty:
-            soy_price = last_year_data.iloc[-1]
-        else: # Fallback if no data from last year
+        boundaries = (
+            np.array([start_of_week, start_of_month, start_of_quarter, start_of_year], dtype='datetime64[D]')
+            - np.timedelta64(1, 'D')
+        ).astype('datetime64[ns]')
+        boundary_prices = data.ffill().reindex(boundaries, method='ffill')
+        sow_price, som_price, soq_price, soy_price = (
+            boundary_prices.iloc[0], boundary_prices.iloc[1], boundary_prices.iloc[2], boundary_prices.iloc[3]
+        )
+
+        if data.index[0] > boundaries[-1]: # Fallback if no data from last year
             soy_price = data[data.index.year == today.year].iloc[0]
 
         # Ensure all start prices are valid
@@ -105,23 +247,63 @@ def calculate_performance_metrics(data):
     except (KeyError, IndexError):
         return pd.DataFrame() # Not enough data to calculate
 
-    # --- Performance Calculations ---
-    perf_1d = (latest_price / data.iloc[-2]) - 1 
-    perf_wtd = (latest_price / sow_price) - 1
-    perf_mtd = (latest_price / som_price) - 1
-    perf_qtd = (latest_price / soq_price) - 1
-    perf_ytd = (latest_price / soy_price) - 1
-    
-    performance_df = pd.DataFrame({
-        "1 Day": perf_1d,
-        "Week To Date (WTD)": perf_wtd,
-        "Month To Date (MTD)": perf_mtd,
-        "Quarter To Date (QTD)": perf_qtd,
-        "Year To Date (YTD)": perf_ytd,
-    })
+    # --- Performance Calculations (one broadcasted divide for all periods) ---
+    start_prices = np.vstack([
+        data.iloc[-2].values,
+        sow_price.values,
+        som_price.values,
+        soq_price.values,
+        soy_price.values,
+    ])
+    performance = latest_price.values / start_prices - 1.0
+
+    # Plain float32 columns convert to Arrow without type inference when sent to the browser
+    performance_df = pd.DataFrame(
+        performance.T.astype(np.float32, copy=False),
+        index=data.columns,
+        columns=[
+            "1 Day",
+            "Week To Date (WTD)",
+            "Month To Date (MTD)",
+            "Quarter To Date (QTD)",
+            "Year To Date (YTD)",
+        ],
+    )
     
     return performance_df
 
+# --- Table Colors (colormaps sampled once into 256-entry RGB lookup tables) ---
+_GREEN_CMAP = mcolors.LinearSegmentedColormap.from_list("green_grad", ["#E8F5E9", "#1B5E20"])
+_RED_CMAP = mcolors.LinearSegmentedColormap.from_list("red_grad", ["#FFEBEE", "#B71C1C"])
+_GREEN_LUT = (_GREEN_CMAP(np.linspace(0, 1, 256))[:, :3] * 255).astype(np.uint8)
+_RED_LUT = (_RED_CMAP(np.linspace(0, 1, 256))[:, :3] * 255).astype(np.uint8)
+_GRAY_COLOR = "#F0F2F6"
+
+def _compute_style_bytes(values, benchmark, green_lut, red_lut):
+    """
+    Maps each cell's difference to the benchmark onto the green/red lookup tables.
+    Returns an (rows, cols, 3) uint8 RGB array and a mask of the cells that get a color.
+    """
+    diffs = values - benchmark
+
+    # Normalize per column for consistent color intensity
+    max_pos_per_col = np.max(diffs, axis=0, where=diffs > 0, initial=0.0)
+    max_neg_per_col = -np.min(diffs, axis=0, where=diffs < 0, initial=0.0)
+
+    rgb = np.zeros(diffs.shape + (3,), dtype=np.uint8)
+    colored = np.zeros(diffs.shape, dtype=bool)
+    for mask, max_per_col, lut in (
+        ((diffs > 0) & (max_pos_per_col > 0), max_pos_per_col, green_lut),
+        ((diffs < 0) & (max_neg_per_col > 0), max_neg_per_col, red_lut),
+    ):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            norm_intensity = np.where(mask, np.abs(diffs) / max_per_col, 0.0)
+        lut_index = np.minimum((np.clip(norm_intensity, 0.0, 1.0) * 256).astype(int), 255)
+        rgb[mask] = lut[lut_index[mask]]
+        colored |= mask
+
+    return rgb, colored
+
 def style_performance_table(df, benchmark_name):
     """
     Applies a distinct green/red gradient relative to the specified benchmark.
@@ -129,54 +311,46 @@ def style_performance_table(df, benchmark_name):
     if benchmark_name not in df.index:
         return df.style.format("{:.2%}").background_gradient(cmap='RdYlGn', axis=None)
 
-    benchmark_row = df.loc[benchmark_name]
-    diffs = df - benchmark_row
+    rgb, colored = _compute_style_bytes(df.values, df.loc[benchmark_name].values, _GREEN_LUT, _RED_LUT)
+
+    styles = np.full(df.shape, "background-color: white; color: black;", dtype=object)
+    styles[colored] = [f"background-color: rgba({r}, {g}, {b}, {0.9});" for r, g, b in rgb[colored]]
+    styles[df.index == benchmark_name] = f"background-color: {_GRAY_COLOR}; color: black;"
+
+    return df.style.apply(lambda _: styles, axis=None).format("{:.2%}")
+
+def select_tickers(data, tickers):
+    """Slice the columns of a given set of tickers out of the combined price data."""
+    return data[[name for name in tickers if name in data.columns]]
+
+@st.fragment
+def _render_chart(performance_table, title):
+    """Display a bar chart of the selected performance metric."""
+    # --- Metric selection for charting ---
+    metric_options = list(performance_table.columns)
+    metric_to_plot = st.selectbox(
+        "Choose a performance metric to visualize:",
+        metric_options,
+        key=f"select_{title}"
+    )
+
+    if metric_to_plot in performance_table.columns:
+        chart_data = performance_table[metric_to_plot].sort_values(ascending=False)
+        chart_data.name = 'Performance'
+        st.bar_chart(chart_data)
+        st.caption("Chart shows performance sorted from best to worst.")
+    else:
+        st.warning(f"Could not find data for '{metric_to_plot}'.")
 
-    # Normalize per column for consistent color intensity
-    max_pos_per_col = diffs[diffs > 0].max()
-    max_neg_per_col = abs(diffs[diffs < 0].min())
-
-    green_cmap = mcolors.LinearSegmentedColormap.from_list("green_grad", ["#E8F5E9", "#1B5E20"])
-    red_cmap = mcolors.LinearSegmentedColormap.from_list("red_grad", ["#FFEBEE", "#B71C1C"])
-    gray_color = "#F0F2F6"
-
-    def color_rows_gradient(row):
-        styles = []
-        for col_name, value in row.items():
-            if row.name == benchmark_name:
-                styles.append(f"background-color: {gray_color}; color: black;")
-                continue
-
-            diff = value - benchmark_row[col_name]
-
-            if diff > 0:
-                max_pos = max_pos_per_col[col_name]
-                if pd.notna(max_pos) and max_pos > 0:
-                    norm_intensity = min(diff / max_pos, 1.0)
-                    rgba = mcolors.to_rgba(green_cmap(norm_intensity))
-                    styles.append(f"background-color: rgba({int(rgba[0]*255)}, {int(rgba[1]*255)}, {int(rgba[2]*255)}, {0.9});")
-                else:
-                    styles.append("background-color: white; color: black;")
-            elif diff < 0:
-                max_neg = max_neg_per_col[col_name]
-                if pd.notna(max_neg) and max_neg > 0:
-                    norm_intensity = min(abs(diff) / max_neg, 1.0)
-                    rgba = mcolors.to_rgba(red_cmap(norm_intensity))
-                    styles.append(f"background-color: rgba({int(rgba[0]*255)}, {int(rgba[1]*255)}, {int(rgba[2]*255)}, {0.9});")
-                else:
-                    styles.append("background-color: white; color: black;")
-            else:
-                 styles.append("background-color: white; color: black;")
-        return styles
-
-    return df.style.apply(color_rows_gradient, axis=1).format("{:.2%}")
-
-def display_performance_section(title, tickers):
+def display_performance_section(title, full_data, tickers):
     """Display a performance table and chart for a given set of tickers."""
     st.header(f"{title} Performance Overview (USD)")
-    start_date = (datetime.now() - pd.DateOffset(years=1)).strftime('%Y-%m-%d')
-    
-    data = get_performance_data(tickers, start_date)
+    one_year_ago = (datetime.now() - pd.DateOffset(years=1)).strftime('%Y-%m-%d')
+
+    # The 1-year window is a suffix of the shared 3-year download, so slice instead of re-downloading
+    data = select_tickers(full_data, tickers)
+    if not data.empty:
+        data = data.loc[one_year_ago:]
     performance_table = calculate_performance_metrics(data)
     
     # --- Dynamic Benchmark Selection ---
@@ -190,64 +364,94 @@ def display_performance_section(title, tickers):
         styled_table = style_performance_table(performance_table, benchmark_name)
         st.dataframe(styled_table, use_container_width=True)
 
-        # --- Metric selection for charting ---
-        metric_options = list(performance_table.columns)
-        metric_to_plot = st.selectbox(
-            "Choose a performance metric to visualize:",
-            metric_options,
-            key=f"select_{title}"
-        )
-
-        if metric_to_plot in performance_table.columns:
-            chart_data = performance_table[[metric_to_plot]].copy()
-            chart_data.columns = ['Performance']
-            chart_data = chart_data.sort_values(by='Performance', ascending=False)
-            st.bar_chart(chart_data)
-            st.caption("Chart shows performance sorted from best to worst.")
-        else:
-            st.warning(f"Could not find data for '{metric_to_plot}'.")
+        # Only the chart depends on the selected metric, so it reruns on its own
+        _render_chart(performance_table, title)
     else:
         st.warning(f"Could not display performance data for {title}.")
 
 
-def display_risk_correlation_section(all_tickers):
+def _rolling_pct_change(values, window):
+    """Percentage change (in %) over a trailing window, written into a single float32 array."""
+    n_rows = max(values.shape[0] - window, 0)
+    out = np.empty((n_rows, values.shape[1]), dtype=np.float32)
+    if n_rows:
+        np.divide(values[window:], values[:-window], out=out)
+        out -= 1.0
+        out *= 100.0
+    return out
+
+
+@st.cache_data(ttl=3600)
+def _compute_corr_and_rolling(data_key, _data):
+    """Compute the correlation matrix of daily returns and the 1-year rolling returns (in %)."""
+    # Same as pct_change(fill_method=None), without its fill-method dispatch
+    returns = _data.div(_data.shift(1)).sub(1.0)
+    corr_matrix = returns.corr()
+    rolling_returns = pd.DataFrame(
+        _rolling_pct_change(_data.values, 252),
+        index=_data.index[252:],
+        columns=_data.columns,
+    ).dropna()
+    return corr_matrix, rolling_returns
+
+
+@st.cache_data(ttl=3600, max_entries=4)
+def _build_heatmap(corr_key, _corr_matrix):
+    """Build the annotated correlation heatmap; reused until the correlation matrix changes."""
+    fig = go.Figure(go.Heatmap(
+        z=_corr_matrix.values,
+        x=_corr_matrix.columns,
+        y=_corr_matrix.index,
+        colorscale='RdBu_r',
+        zmid=0,
+        text=_corr_matrix.round(2).values,
+        texttemplate='%{text}',
+        xgap=1,
+        ygap=1,
+    ))
+    # Rendered in the browser; list the first asset at the top like a correlation table
+    fig.update_yaxes(autorange='reversed')
+    fig.update_layout(height=750)
+    return fig
+
+
+def display_risk_correlation_section(data):
     """New section for Correlation and Rolling Performance analysis."""
     st.header("Risk & Correlation Analysis (USD)")
-    start_date = (datetime.now() - pd.DateOffset(years=3)).strftime('%Y-%m-%d')
-    data = get_performance_data(all_tickers, start_date)
 
     if not data.empty:
         st.subheader("Correlation Heatmap")
         st.write("This grid shows how different assets move in relation to each other. A value of 1 means they move perfectly together; a value of 0 means they have no relationship.")
         
-        # Address FutureWarning by specifying fill_method=None
-        returns = data.pct_change(fill_method=None)
-        corr_matrix = returns.corr()
+        # Key the cached results on the bar set, so they are recomputed only when the data changes
+        data_key = (tuple(data.columns), data.index[-1], data.iloc[-1].values.tobytes())
+        corr_matrix, rolling_returns = _compute_corr_and_rolling(data_key, data)
 
-        fig, ax = plt.subplots(figsize=(12, 9))
-        sns.heatmap(corr_matrix, annot=True, cmap='coolwarm', fmt=".2f", linewidths=.5, ax=ax)
-        st.pyplot(fig)
+        corr_key = (tuple(corr_matrix.columns), corr_matrix.values.tobytes())
+        fig = _build_heatmap(corr_key, corr_matrix)
+        st.plotly_chart(fig, use_container_width=True)
 
         st.subheader("1-Year Rolling Performance")
         st.write("This chart shows the trailing 1-year performance for each asset over the last 3 years, helping to visualize long-term trends and cyclicality.")
         
-        # Address FutureWarning by specifying fill_method=None
-        rolling_returns = (data.pct_change(252, fill_method=None).dropna()) * 100
         st.line_chart(rolling_returns)
 
 # --- Main App Logic ---
-ALL_TICKERS = {**FACTOR_TICKERS, **REGION_TICKERS, **SECTOR_TICKERS}
+
+# Download the 3-year history of every ticker once and slice it per tab
+three_years_ago = (datetime.now() - pd.DateOffset(years=3)).strftime('%Y-%m-%d')
+full_data = get_performance_data(ALL_TICKERS, three_years_ago)
 
 tab1, tab2, tab3, tab4 = st.tabs(["Factor", "Regional", "Sector", "Risk & Correlation"])
 
 with tab1:
-    display_performance_section("Factor", FACTOR_TICKERS)
+    display_performance_section("Factor", full_data, FACTOR_TICKERS)
 with tab2:
-    display_performance_section("Regional", REGION_TICKERS)
+    display_performance_section("Regional", full_data, REGION_TICKERS)
 with tab3:
-    display_performance_section("Sector", SECTOR_TICKERS)
+    display_performance_section("Sector", full_data, SECTOR_TICKERS)
 with tab4:
-    display_risk_correlation_section(ALL_TICKERS)
+    display_risk_correlation_section(full_data)
 
 st.markdown(f"--- \n_*Data last updated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}*_")
 